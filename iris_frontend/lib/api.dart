@@ -75,8 +75,20 @@ class IrisApi {
   }
 
   /// Fetch conversations (sidebar)
-  static Future<List<ConversationMeta>> fetchConversations() async {
-    final res = await http.get(Uri.parse('$_baseUrl/conversations'));
+  ///
+  /// [sort] is `id` (oldest first) or `updated` (most recent activity first).
+  /// Pass [limit] to fetch a single page; older pages follow via [cursor].
+  static Future<List<ConversationMeta>> fetchConversations({
+    String sort = 'id',
+    int? limit,
+    String? cursor,
+  }) async {
+    final uri = Uri.parse('$_baseUrl/conversations').replace(queryParameters: {
+      'sort': sort,
+      if (limit != null) 'limit': '$limit',
+      if (cursor != null) 'cursor': cursor,
+    });
+    final res = await http.get(uri);
     if (res.statusCode != 200) {
       throw Exception("Failed to fetch conversations");
     }
@@ -109,6 +121,34 @@ class IrisApi {
     return messages.map((m) => ChatMessage.fromJson(m)).toList();
   }
 
+  /// Get the messages of many conversations in one NDJSON request
+  static Future<Map<int, List<ChatMessage>>> getConversations(
+      List<int> convIds) async {
+    final request =
+        http.Request('POST', Uri.parse('$_baseUrl/conversations/batch'));
+    request.headers['Content-Type'] = 'application/json';
+    request.body = jsonEncode({"ids": convIds});
+
+    final response = await request.send();
+    if (response.statusCode != 200) {
+      throw Exception("Failed to fetch conversations");
+    }
+
+    final result = <int, List<ChatMessage>>{};
+    final lines = response.stream
+        .transform(utf8.decoder)
+        .transform(const LineSplitter());
+    await for (final line in lines) {
+      if (line.trim().isEmpty) continue;
+      final data = jsonDecode(line);
+      if (data['messages'] == null) continue;
+      final List messages = data['messages'];
+      result[data['conversation']] =
+          messages.map((m) => ChatMessage.fromJson(m)).toList();
+    }
+    return result;
+  }
+
   /// Update a conversation's title
   static Future<void> updateConversation(int convId, String newTitle) async {
     final res = await http.put(
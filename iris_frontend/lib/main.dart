@@ -216,11 +216,11 @@ class _ChatScreenState extends State<ChatScreen>
     return;
   }
 
+  final fetched =
+      await IrisApi.getConversations(result.map((c) => c.id).toList());
   final newConversationMessages = <int, List<ChatMessage>>{};
   for (final conv in result) {
-    final messages = await IrisApi.getConversation(conv.id);
-    newConversationMessages[conv.id] =
-        messages.map((m) => ChatMessage(m.text, isUser: m.isUser)).toList();
+    newConversationMessages[conv.id] = fetched[conv.id] ?? [];
   }
 
   setState(() {
@@ -1,15 +1,38 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request, Response
 from fastapi.responses import StreamingResponse, JSONResponse
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import ollama
 import os
 import json
+import asyncio
+import base64
+import ctypes
+import ctypes.util
+import queue
+import select
+import struct
+import zlib
 import hashlib
+import heapq
+import itertools
 import logging
+import sqlite3
+import tempfile
 import threading
 import time
-from contextlib import asynccontextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: allocation is only serialized within the process
+    fcntl = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 
 # =========================================================
@@ -19,15 +42,24 @@ from contextlib import asynccontextmanager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global stop_event, background_memory_thread
+    global stop_event, background_memory_thread, startup_scan_thread
     stop_event = threading.Event()
-    update_global_memory_full_scan()
+    job_queue.start()
+    if STARTUP_SCAN == "blocking":
+        update_global_memory_full_scan()
+    else:
+        # Serve with the last persisted global.json while it is rebuilt
+        startup_scan_thread = threading.Thread(target=update_global_memory_full_scan, daemon=True)
+        startup_scan_thread.start()
     background_memory_thread = threading.Thread(target=background_memory_update, daemon=True)
     background_memory_thread.start()
     yield
     # Shutdown
     stop_event.set()
     background_memory_thread.join()
+    if startup_scan_thread is not None:
+        startup_scan_thread.join()
+    job_queue.stop()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -35,9 +67,83 @@ CONV_DIR = "conversations"
 MEMORY_DIR = "memory"
 GLOBAL_MEMORY_PATH = os.path.join(MEMORY_DIR, "global.json")
 CONV_MEMORY_DIR = os.path.join(MEMORY_DIR, "per_conversation")
+PROVENANCE_PATH = os.path.join(MEMORY_DIR, "provenance.json")
+STATE_DIR = "state"
+INDEX_PATH = os.path.join(STATE_DIR, "index.json")
+INDEX_LOG_PATH = os.path.join(STATE_DIR, "index.log.jsonl")
+NEXT_ID_PATH = os.path.join(STATE_DIR, "next_id")
+CHANGES_PATH = os.path.join(STATE_DIR, "changes.jsonl")
+SNAPSHOT_CACHE_PATH = os.path.join(STATE_DIR, "snapshot_cache.json")
+BLOB_DIR = os.path.join(STATE_DIR, "blobs")
+JOBS_DB_PATH = os.path.join(STATE_DIR, "jobs.db")
+SEGMENT_SUMMARY_DIR = os.path.join(STATE_DIR, "segment_summaries")
+
+# "json" keeps one file per conversation, "log" appends each turn to a
+# JSONL log next to it, "sqlite" keeps everything in DB_PATH
+STORAGE_BACKEND = os.environ.get("IRIS_STORAGE", "json")
+DB_PATH = os.environ.get("IRIS_DB_PATH", "iris.db")
+LOG_COMPACT_BYTES = int(os.environ.get("IRIS_LOG_COMPACT_BYTES", 256 * 1024))
+INDEX_COMPACT_BYTES = int(os.environ.get("IRIS_INDEX_COMPACT_BYTES", 1024 * 1024))
+
+# "group" batches fsyncs of concurrent save_json calls, "always" fsyncs each
+# write, "off" only relies on the atomic rename
+FSYNC_MODE = os.environ.get("IRIS_FSYNC", "group")
+GROUP_COMMIT_WINDOW = float(os.environ.get("IRIS_GROUP_COMMIT_MS", 5)) / 1000
+
+BULK_READ_WORKERS = int(os.environ.get("IRIS_BULK_READ_WORKERS", 8))
+
+# "background" serves requests while global memory is rebuilt at startup,
+# "blocking" waits for the rebuild before accepting requests
+STARTUP_SCAN = os.environ.get("IRIS_STARTUP_SCAN", "background")
+
+# Background LLM calls in flight at once; match the Ollama server's
+# OLLAMA_NUM_PARALLEL so requests are not just queued server-side
+OLLAMA_PARALLEL = int(os.environ.get("IRIS_OLLAMA_PARALLEL", os.environ.get("OLLAMA_NUM_PARALLEL", 2)))
+MEMORY_WORKERS = int(os.environ.get("IRIS_MEMORY_WORKERS", OLLAMA_PARALLEL))
+
+# Small conversations are packed into one extraction request up to this
+# many (estimated) tokens; 0 sends every conversation on its own
+EXTRACTION_BATCH_TOKENS = int(os.environ.get("IRIS_EXTRACTION_BATCH_TOKENS", 2000))
+
+# A background job that failed (or was interrupted by a crash) this many
+# times is marked failed until it is submitted again
+JOB_MAX_ATTEMPTS = int(os.environ.get("IRIS_JOB_MAX_ATTEMPTS", 3))
+
+# A conversation summary is refreshed once this many user turns, or this
+# many (estimated) tokens, were added since the last one, or once the
+# conversation has been idle this many seconds
+SUMMARY_EVERY_TURNS = int(os.environ.get("IRIS_SUMMARY_TURNS", 4))
+SUMMARY_TOKEN_GROWTH = int(os.environ.get("IRIS_SUMMARY_TOKENS", 1500))
+SUMMARY_IDLE_SECONDS = float(os.environ.get("IRIS_SUMMARY_IDLE", 120))
+
+# "incremental" updates the previous summary with the messages added since
+# it was written, "full" re-summarizes the whole history every time
+SUMMARY_MODE = os.environ.get("IRIS_SUMMARY_MODE", "incremental")
+
+# Messages to summarize that do not fit in SUMMARY_CONTEXT_TOKENS (estimated)
+# are split into segments of SUMMARY_SEGMENT_TOKENS, summarized separately
+# and then combined (see map_reduce_summary)
+SUMMARY_CONTEXT_TOKENS = int(os.environ.get("IRIS_SUMMARY_CONTEXT_TOKENS", 3000))
+SUMMARY_SEGMENT_TOKENS = int(os.environ.get("IRIS_SUMMARY_SEGMENT_TOKENS", 1500))
+# Segment summaries kept on disk; the least recently used go first
+SEGMENT_SUMMARY_CACHE_SIZE = int(os.environ.get("IRIS_SEGMENT_CACHE_SIZE", 5000))
+
+# Change-detection hash: "xxhash" (needs the xxhash package), "blake2b"
+# (16-byte digest) or "md5"; "auto" picks xxhash when it is installed
+HASH_ALGORITHM = os.environ.get("IRIS_HASH", "auto")
+if HASH_ALGORITHM in ("auto", "xxhash"):
+    HASH_ALGORITHM = "xxhash" if xxhash is not None else "blake2b"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# "auto" watches CONV_DIR with inotify where available and polls otherwise
+WATCH_MODE = os.environ.get("IRIS_WATCH", "auto")
+WATCH_DEBOUNCE = float(os.environ.get("IRIS_WATCH_DEBOUNCE", 2))
 
 os.makedirs(CONV_DIR, exist_ok=True)
 os.makedirs(CONV_MEMORY_DIR, exist_ok=True)
+os.makedirs(STATE_DIR, exist_ok=True)
+os.makedirs(BLOB_DIR, exist_ok=True)
+os.makedirs(SEGMENT_SUMMARY_DIR, exist_ok=True)
 
 if not os.path.exists(GLOBAL_MEMORY_PATH):
     with open(GLOBAL_MEMORY_PATH, "w") as f:
@@ -56,6 +162,53 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 memory_lock = threading.Lock()
 stop_event = None
 background_memory_thread = None
+startup_scan_thread = None
+
+class OllamaSlots:
+    """Model server request slots; background calls only use slots no chat stream needs."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self._cond = threading.Condition()
+        self._interactive = 0
+        self._background = 0
+
+    @contextmanager
+    def interactive(self):
+        with self._cond:
+            self._interactive += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._interactive -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def background(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._interactive + self._background < self.total)
+            self._background += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._background -= 1
+                self._cond.notify_all()
+
+ollama_slots = OllamaSlots(OLLAMA_PARALLEL)
+
+def background_chat(**kwargs):
+    with ollama_slots.background():
+        return ollama.chat(**kwargs)
+
+# Progress of update_global_memory_full_scan, served by GET /memory/status
+rebuild_status = {"state": "idle"}
+rebuild_status_lock = threading.Lock()
+
+def set_rebuild_status(**fields):
+    with rebuild_status_lock:
+        rebuild_status.update(fields)
 
 # =========================================================
 # Models
@@ -77,6 +230,11 @@ class ConversationCreate(BaseModel):
 class MemoryUpdate(BaseModel):
     content: str
 
+class ConversationBatch(BaseModel):
+    # Either explicit ids, or the `limit` most recently active conversations
+    ids: Optional[List[int]] = None
+    limit: Optional[int] = Field(None, ge=1)
+
 # =========================================================
 # Utility Helpers
 # =========================================================
@@ -87,16 +245,1125 @@ def load_json(path: str, default):
     with open(path) as f:
         return json.load(f)
 
+def fsync_dir(path: str):
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return  # Directories cannot be opened on Windows
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class GroupCommitter:
+    """Batches concurrent atomic writes so they share one fsync/rename/dir-sync pass."""
+
+    def __init__(self, window: float):
+        self.window = window
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._batch = self._new_batch()
+        self._writing = 0  # writers that have not called commit yet
+
+    @staticmethod
+    def _new_batch() -> dict:
+        return {"files": {}, "has_leader": False, "done": False, "error": None}
+
+    def begin(self):
+        """Register a writer; it must end with commit() or abandon()."""
+        with self._cond:
+            self._writing += 1
+
+    def abandon(self):
+        with self._cond:
+            self._writing -= 1
+            self._cond.notify_all()
+
+    def commit(self, path: str, tmp: str):
+        with self._cond:
+            self._writing -= 1
+            self._cond.notify_all()
+            batch = self._batch
+            superseded = batch["files"].get(path)
+            if superseded:
+                os.remove(superseded)
+            batch["files"][path] = tmp
+            leader = not batch["has_leader"]
+            batch["has_leader"] = True
+
+        if leader:
+            with self._cond:
+                deadline = time.monotonic() + self.window
+                while self._writing > 0 and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+            # Close the batch only once the previous one is on disk
+            with self._flush_lock:
+                with self._cond:
+                    self._batch = self._new_batch()
+                try:
+                    self._flush(batch["files"])
+                except OSError as e:
+                    batch["error"] = e
+            with self._cond:
+                batch["done"] = True
+                self._cond.notify_all()
+        else:
+            with self._cond:
+                while not batch["done"]:
+                    self._cond.wait()
+
+        if batch["error"]:
+            raise batch["error"]
+
+    def _flush(self, files: dict):
+        for tmp in files.values():
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+        for path, tmp in files.items():
+            os.replace(tmp, path)
+        for directory in {os.path.dirname(p) for p in files}:
+            fsync_dir(directory)
+
+
+group_committer = GroupCommitter(GROUP_COMMIT_WINDOW)
+
 def save_json(path: str, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2)
+    """
+    Atomically replace path with data: write a temp file next to it and
+    rename it over the target, so a crash leaves either the old or the new
+    file, never a truncated one.
+    """
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(
+        dir=directory or ".", prefix=os.path.basename(path) + ".", suffix=".tmp"
+    )
+    grouped = FSYNC_MODE == "group"
+    if grouped:
+        group_committer.begin()
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps(data))
+            if FSYNC_MODE == "always":
+                f.flush()
+                os.fsync(f.fileno())
+        if grouped:
+            grouped = False  # commit() ends the registration
+            group_committer.commit(path, tmp)
+        else:
+            os.replace(tmp, path)
+            if FSYNC_MODE == "always":
+                fsync_dir(directory)
+    except BaseException:
+        if grouped:
+            group_committer.abandon()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
 
 def conv_path(conv_id: int) -> str:
     return os.path.join(CONV_DIR, f"conv_{conv_id}.json")
 
+def conv_log_path(conv_id: int) -> str:
+    return os.path.join(CONV_DIR, f"conv_{conv_id}.log.jsonl")
+
 def conv_memory_path(conv_id: int) -> str:
     return os.path.join(CONV_MEMORY_DIR, f"conv_{conv_id}.json")
 
+def conv_id_from_filename(name: str) -> int:
+    return int(name.split("_")[1].split(".")[0])
+
+def message_window(total: int, before: int = None, limit: int = None):
+    """[start, end) of the `limit` messages preceding index `before`."""
+    end = total if before is None else max(0, min(before, total))
+    start = 0 if limit is None else max(0, end - limit)
+    return start, end
+
+# =========================================================
+# Snapshot Blob Store
+# =========================================================
+
+def blob_path(ref: str) -> str:
+    return os.path.join(BLOB_DIR, ref[:2], f"{ref}.json")
+
+def put_blob(data) -> str:
+    """Store data under the SHA-256 of its canonical JSON; identical data is stored once."""
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    ref = hashlib.sha256(encoded.encode()).hexdigest()
+    path = blob_path(ref)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_json(path, data)
+    return ref
+
+def get_blob(ref: str, default=None):
+    return load_json(blob_path(ref), default)
+
+def put_snapshot(snap: dict) -> str:
+    """
+    Merkle snapshots are stored bucket by bucket, so buckets that did not
+    change between two snapshots are shared instead of written again.
+    """
+    if not is_merkle(snap):
+        return put_blob(snap)
+    return put_blob({
+        "root": snap["root"],
+        "buckets": {
+            key: {"hash": bucket["hash"], "ref": put_blob(bucket["files"])}
+            for key, bucket in snap["buckets"].items()
+        }
+    })
+
+def get_snapshot(ref: str) -> dict:
+    snap = get_blob(ref, {})
+    if is_merkle(snap):
+        for bucket in snap["buckets"].values():
+            bucket["files"] = get_blob(bucket.pop("ref"), {})
+    return snap
+
+DIRECTORY_KEYS = ("directory", "directory_diff")
+
+def store_directory(data: dict) -> dict:
+    """Replace inline directory snapshot/diff of a conversation with blob refs."""
+    data = dict(data)
+    for key in DIRECTORY_KEYS:
+        if key in data:
+            data[f"{key}_ref"] = put_snapshot(data.pop(key))
+    return data
+
+def resolve_directory(data: dict) -> dict:
+    """Inverse of store_directory; inline (pre-blob) snapshots are left as they are."""
+    for key in DIRECTORY_KEYS:
+        ref = data.pop(f"{key}_ref", None)
+        if ref is not None:
+            data[key] = get_snapshot(ref)
+    return data
+
+def drop_directory(data: dict) -> dict:
+    for key in DIRECTORY_KEYS:
+        data.pop(key, None)
+        data.pop(f"{key}_ref", None)
+    return data
+
+# =========================================================
+# Change Feed
+# =========================================================
+
+class ChangeFeed:
+    """Append-only, flock'ed log of changes with a monotonically increasing seq."""
+
+    COMPACT_RATIO = 4
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._latest = {}  # (kind, id) -> record
+        self._records = 0
+        self._seq = 0
+        self._offset = 0
+        self._inode = None
+
+    def _catch_up(self, f):
+        # Pick up records appended by other processes since our last read
+        inode = os.fstat(f.fileno()).st_ino
+        if inode != self._inode:
+            self._latest, self._records, self._seq, self._offset = {}, 0, 0, 0
+            self._inode = inode
+        f.seek(self._offset)
+        for line in f:
+            if not line.endswith("\n"):
+                break  # torn or in-flight append
+            self._offset += len(line.encode())
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self._latest[(record["kind"], record["id"])] = record
+            self._records += 1
+            self._seq = max(self._seq, record["seq"])
+
+    def _open_locked(self):
+        # Retry if another process compacted (replaced) the file while we waited
+        while True:
+            f = open(self.path, "a+")
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                return f
+            f.close()
+
+    def append(self, kind: str, conv_id, action: str) -> int:
+        with self._lock, self._open_locked() as f:
+            self._catch_up(f)
+            self._seq += 1
+            record = {
+                "seq": self._seq,
+                "kind": kind,
+                "id": conv_id,
+                "action": action,
+                "time": time.time()
+            }
+            line = json.dumps(record) + "\n"
+            f.seek(0, os.SEEK_END)
+            f.write(line)
+            f.flush()
+            self._offset += len(line.encode())
+            self._latest[(kind, conv_id)] = record
+            self._records += 1
+            if self._records > self.COMPACT_RATIO * max(len(self._latest), 16):
+                self._compact()
+            return self._seq
+
+    def _compact(self):
+        records = sorted(self._latest.values(), key=lambda r: r["seq"])
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as out:
+            out.writelines(json.dumps(r) + "\n" for r in records)
+        os.replace(tmp, self.path)
+        self._inode = os.stat(self.path).st_ino
+        self._offset = os.path.getsize(self.path)
+        self._records = len(records)
+
+    def _refresh(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            self._catch_up(f)
+
+    def last_seq(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._seq
+
+    def since(self, seq: int) -> List[dict]:
+        """Latest change per (kind, id) made after seq, oldest first."""
+        with self._lock:
+            self._refresh()
+            return sorted(
+                (r for r in self._latest.values() if r["seq"] > seq),
+                key=lambda r: r["seq"]
+            )
+
+
+change_feed = ChangeFeed(CHANGES_PATH)
+
+# =========================================================
+# Conversation Index
+# =========================================================
+
+class ConversationIndex:
+    """Per-conversation listing metadata: snapshot plus append-only log, shared across processes."""
+
+    def __init__(self, path: str, log_path: str, compact_bytes: int = INDEX_COMPACT_BYTES):
+        self.path = path
+        self.log_path = log_path
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._entries = None
+        self._version = 0
+        self._snapshot_stat = None
+        self._offset = 0  # bytes of the log already applied
+
+    def _stat_snapshot(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _load(self) -> dict:
+        # Catch up on what other processes wrote since our last read
+        snapshot_stat = self._stat_snapshot()
+        try:
+            size = os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            size = 0
+        if self._entries is None or snapshot_stat != self._snapshot_stat or size < self._offset:
+            # First load, or the log was compacted into a new snapshot
+            data = load_json(self.path, {"conversations": {}})
+            self._entries = {int(k): v for k, v in data["conversations"].items()}
+            self._version = data.get("version", 0)
+            self._snapshot_stat = snapshot_stat
+            self._offset = 0
+        if size > self._offset:
+            with open(self.log_path, "rb") as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn or in-flight append
+                    self._offset += len(line)
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        continue
+                    if op["version"] <= self._version:
+                        continue  # already in the snapshot
+                    if op["op"] == "put":
+                        self._entries[op["entry"]["id"]] = op["entry"]
+                    elif op["op"] == "remove":
+                        self._entries.pop(op["id"], None)
+                    self._version = op["version"]
+        return self._entries
+
+    @contextmanager
+    def _writing(self):
+        # flock on the log serializes writers across processes
+        with self._lock, open(self.log_path, "ab") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            self._load()
+            yield f
+
+    def _append(self, f, op: dict):
+        """Inside _writing, after applying op to self._entries."""
+        self._version += 1
+        if os.fstat(f.fileno()).st_size > self._offset:
+            # Torn record from a crash mid-append
+            f.truncate(self._offset)
+            logging.warning(f"Dropped torn record at end of {self.log_path}")
+        line = (json.dumps(dict(op, version=self._version)) + "\n").encode()
+        f.write(line)
+        f.flush()
+        self._offset += len(line)
+        if self._offset >= self.compact_bytes:
+            self._compact(f)
+
+    def _compact(self, f):
+        """Inside _writing."""
+        save_json(self.path, {"version": self._version, "conversations": self._entries})
+        f.truncate(0)
+        self._snapshot_stat = self._stat_snapshot()
+        self._offset = 0
+
+    def version(self) -> int:
+        with self._lock:
+            self._load()
+            return self._version
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path) or os.path.exists(self.log_path)
+
+    def record(self, conv_id: int, title: str = None, message_count: int = None, size: int = None):
+        with self._writing() as f:
+            entries = self._entries
+            action = "updated" if conv_id in entries else "created"
+            entry = entries.get(conv_id) or {
+                "id": conv_id,
+                "title": "New Conversation",
+                "message_count": 0,
+                "size": 0,
+                "revision": 0
+            }
+            if title is not None:
+                entry["title"] = title
+            if message_count is not None:
+                entry["message_count"] = message_count
+            if size is not None:
+                entry["size"] = size
+            entry["updated_at"] = time.time()
+            entry["revision"] = entry.get("revision", 0) + 1
+            entries[conv_id] = entry
+            self._append(f, {"op": "put", "entry": entry})
+        change_feed.append("conversation", conv_id, action)
+
+    def bump(self, conv_id: int):
+        """New revision without touching updated_at, e.g. for memory writes."""
+        with self._writing() as f:
+            entry = self._entries.get(conv_id)
+            if entry is None:
+                return
+            entry["revision"] = entry.get("revision", 0) + 1
+            self._append(f, {"op": "put", "entry": entry})
+        change_feed.append("memory", conv_id, "updated")
+
+    def revision(self, conv_id: int):
+        with self._lock:
+            entry = self._load().get(conv_id)
+            return entry.get("revision", 0) if entry else None
+
+    def remove(self, conv_id: int):
+        with self._writing() as f:
+            if self._entries.pop(conv_id, None) is None:
+                return
+            self._append(f, {"op": "remove", "id": conv_id})
+        change_feed.append("conversation", conv_id, "deleted")
+
+    def get(self, conv_id: int):
+        with self._lock:
+            entry = self._load().get(conv_id)
+            return dict(entry) if entry else None
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            return [dict(e) for _, e in sorted(self._load().items())]
+
+    def rebuild(self, conv_store) -> int:
+        """Recreate the index by reading every conversation once."""
+        entries = {}
+        for conv_id in conv_store.ids():
+            data = conv_store.load(conv_id, None)
+            if data is None:
+                continue
+            entries[conv_id] = {
+                "id": conv_id,
+                "title": data.get("title", "New Conversation"),
+                "message_count": len(data.get("messages", [])),
+                "size": conv_store.size(conv_id),
+                "updated_at": conv_store.updated_at(conv_id)
+            }
+        with self._writing() as f:
+            # Keep revisions increasing so cached ETags never match new content
+            for conv_id, entry in entries.items():
+                old = (self._entries.get(conv_id) or {}).get("revision", 0)
+                entry["revision"] = old + 1
+            self._entries = entries
+            self._version += 1
+            self._compact(f)
+        logging.info(f"Rebuilt conversation index with {len(entries)} entries")
+        return len(entries)
+
+    def reconcile(self, conv_store):
+        """Cheap staleness check: fix up ids that were added or removed behind our back."""
+        stored = set(conv_store.ids())
+        with self._lock:
+            indexed = set(self._load())
+        for conv_id in indexed - stored:
+            self.remove(conv_id)
+        for conv_id in stored - indexed:
+            data = conv_store.load(conv_id, None) or {}
+            self.record(
+                conv_id,
+                title=data.get("title"),
+                message_count=len(data.get("messages", [])),
+                size=conv_store.size(conv_id)
+            )
+
+
+conversation_index = ConversationIndex(INDEX_PATH, INDEX_LOG_PATH)
+
+
+class IdAllocator:
+    """Monotonic conversation ids from a flock'ed counter file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def next(self, seed) -> int:
+        with self._lock, open(self.path, "a+") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            raw = f.read().strip()
+            value = int(raw) if raw else seed()
+            f.seek(0)
+            f.truncate()
+            f.write(str(value + 1))
+            f.flush()
+            os.fsync(f.fileno())
+            return value
+
+
+def first_free_id() -> int:
+    # Only consulted when the counter file does not exist yet
+    return max((e["id"] for e in conversation_index.list()), default=-1) + 1
+
+id_allocator = IdAllocator(NEXT_ID_PATH)
+
+# =========================================================
+# Conversation Storage
+# =========================================================
+
+class JsonConversationStore:
+    """One JSON file per conversation and per conversation memory."""
+
+    def __init__(self):
+        self._conv_locks = {}
+        self._conv_locks_guard = threading.Lock()
+
+    def _conv_lock(self, conv_id: int) -> threading.RLock:
+        with self._conv_locks_guard:
+            return self._conv_locks.setdefault(conv_id, threading.RLock())
+
+    def exists(self, conv_id: int) -> bool:
+        return os.path.exists(conv_path(conv_id))
+
+    def allocate_id(self) -> int:
+        return id_allocator.next(first_free_id)
+
+    def ids(self) -> List[int]:
+        ids = []
+        for f in os.listdir(CONV_DIR):
+            if f.startswith("conv_") and f.endswith(".json"):
+                try:
+                    ids.append(conv_id_from_filename(f))
+                except (ValueError, IndexError):
+                    pass
+        return sorted(ids)
+
+    def load(self, conv_id: int, default=None):
+        return load_json(conv_path(conv_id), default)
+
+    def load_window(self, conv_id: int, before: int = None, limit: int = None,
+                    include_directory: bool = False):
+        # A JSON document has to be parsed whole; only the response is sliced
+        data = self.load(conv_id, None)
+        if data is None:
+            return None
+        messages = data.get("messages", [])
+        start, end = message_window(len(messages), before, limit)
+        data["messages"] = messages[start:end]
+        if include_directory:
+            resolve_directory(data)
+        else:
+            drop_directory(data)
+        return data, start, len(messages)
+
+    def save(self, conv_id: int, data: dict):
+        with self._conv_lock(conv_id):
+            save_json(conv_path(conv_id), store_directory(data))
+        conversation_index.record(
+            conv_id,
+            title=data.get("title"),
+            message_count=len(data.get("messages", [])),
+            size=self.size(conv_id)
+        )
+
+    def size(self, conv_id: int) -> int:
+        return sum(
+            os.path.getsize(p) for p in [conv_path(conv_id), conv_log_path(conv_id)]
+            if os.path.exists(p)
+        )
+
+    def updated_at(self, conv_id: int) -> float:
+        return max(
+            (os.path.getmtime(p) for p in [conv_path(conv_id), conv_log_path(conv_id)]
+             if os.path.exists(p)),
+            default=0
+        )
+
+    def save_turn(self, conv_id: int, messages: List[dict], fields: dict):
+        with self._conv_lock(conv_id):
+            data = self.load(conv_id, {}) or {}
+            data.update(fields)
+            data["conversation"] = conv_id
+            data["messages"] = messages
+            self.save(conv_id, data)
+
+    def set_fields(self, conv_id: int, fields: dict):
+        """Update conversation metadata (e.g. the title) without touching its messages."""
+        with self._conv_lock(conv_id):
+            data = self.load(conv_id, None)
+            if data is not None:
+                data.update(fields)
+                self.save(conv_id, data)
+
+    def delete(self, conv_id: int):
+        for p in [conv_path(conv_id), conv_memory_path(conv_id)]:
+            if os.path.exists(p):
+                os.remove(p)
+        conversation_index.remove(conv_id)
+
+    def load_memory(self, conv_id: int, default):
+        return load_json(conv_memory_path(conv_id), default)
+
+    def save_memory(self, conv_id: int, memory: dict):
+        save_json(conv_memory_path(conv_id), memory)
+        conversation_index.bump(conv_id)
+
+    def fingerprints(self) -> dict:
+        return build_merkle(snapshot_directory())
+
+
+class SqliteConversationStore:
+    """Conversations, messages (one row each) and memory in one SQLite database."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY,
+        title TEXT,
+        context TEXT,
+        directory TEXT NOT NULL DEFAULT '{}',
+        directory_diff TEXT NOT NULL DEFAULT '{}',
+        directory_ref TEXT,
+        directory_diff_ref TEXT,
+        revision INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+        conv_id INTEGER NOT NULL,
+        idx INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (conv_id, idx)
+    );
+    CREATE TABLE IF NOT EXISTS conv_memory (
+        conv_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS store_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+            # Databases created before snapshots moved to the blob store
+            columns = {r[1] for r in conn.execute("PRAGMA table_info(conversations)")}
+            for column in ("directory_ref", "directory_diff_ref"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE conversations ADD COLUMN {column} TEXT")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def exists(self, conv_id: int) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM conversations WHERE id = ?", (conv_id,)
+        ).fetchone()
+        return row is not None
+
+    def allocate_id(self) -> int:
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes
+        # cannot both read the same next_id
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM store_meta WHERE key = 'next_id'"
+            ).fetchone()
+            if row:
+                value = int(row[0])
+            else:
+                value = conn.execute(
+                    "SELECT COALESCE(MAX(id) + 1, 0) FROM conversations"
+                ).fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('next_id', ?)",
+                (str(value + 1),)
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return value
+
+    def ids(self) -> List[int]:
+        rows = self._conn().execute("SELECT id FROM conversations ORDER BY id")
+        return [r[0] for r in rows]
+
+    def load(self, conv_id: int, default=None):
+        window = self._read(conv_id, None, None)
+        return default if window is None else window[0]
+
+    def load_window(self, conv_id: int, before: int = None, limit: int = None,
+                    include_directory: bool = False):
+        window = self._read(conv_id, before, limit)
+        if window is not None:
+            if include_directory:
+                resolve_directory(window[0])
+            else:
+                drop_directory(window[0])
+        return window
+
+    def _read(self, conv_id: int, before: int, limit: int):
+        # Only the requested rows are read, via the (conv_id, idx) primary key
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT title, context, directory, directory_diff, directory_ref, directory_diff_ref "
+            "FROM conversations WHERE id = ?",
+            (conv_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        title, context, directory, directory_diff, directory_ref, directory_diff_ref = row
+        total = conn.execute(
+            "SELECT COUNT(*) FROM messages WHERE conv_id = ?", (conv_id,)
+        ).fetchone()[0]
+        start, end = message_window(total, before, limit)
+        messages = conn.execute(
+            "SELECT role, content FROM messages WHERE conv_id = ? AND idx >= ? AND idx < ? "
+            "ORDER BY idx",
+            (conv_id, start, end)
+        )
+        data = {"conversation": conv_id}
+        if title is not None:
+            data["title"] = title
+        data.update({
+            "context": context,
+            "messages": [{"role": r, "content": c} for r, c in messages]
+        })
+        # Rows migrated before the blob store may still hold inline snapshots
+        if directory_ref is not None:
+            data["directory_ref"] = directory_ref
+        else:
+            data["directory"] = json.loads(directory)
+        if directory_diff_ref is not None:
+            data["directory_diff_ref"] = directory_diff_ref
+        else:
+            data["directory_diff"] = json.loads(directory_diff)
+        return data, start, total
+
+    def _upsert_row(self, conn, conv_id: int, fields: dict):
+        conn.execute(
+            "INSERT INTO conversations (id) VALUES (?) ON CONFLICT(id) DO NOTHING",
+            (conv_id,)
+        )
+        for key in ("title", "context"):
+            if key in fields:
+                conn.execute(
+                    f"UPDATE conversations SET {key} = ? WHERE id = ?",
+                    (fields[key], conv_id)
+                )
+        fields = store_directory(fields)
+        for key in ("directory_ref", "directory_diff_ref"):
+            if key in fields:
+                conn.execute(
+                    f"UPDATE conversations SET {key} = ? WHERE id = ?",
+                    (fields[key], conv_id)
+                )
+        conn.execute(
+            "UPDATE conversations SET revision = revision + 1, updated_at = ? WHERE id = ?",
+            (time.time(), conv_id)
+        )
+
+    def _insert_messages(self, conn, conv_id: int, start: int, messages: List[dict]):
+        conn.executemany(
+            "INSERT OR REPLACE INTO messages (conv_id, idx, role, content) VALUES (?, ?, ?, ?)",
+            [(conv_id, start + i, m["role"], m["content"]) for i, m in enumerate(messages)]
+        )
+
+    def save(self, conv_id: int, data: dict):
+        conn = self._conn()
+        with conn:
+            self._upsert_row(conn, conv_id, data)
+            conn.execute("DELETE FROM messages WHERE conv_id = ?", (conv_id,))
+            self._insert_messages(conn, conv_id, 0, data.get("messages", []))
+        self._index(conv_id, data.get("title"), data.get("messages", []))
+
+    def _index(self, conv_id: int, title, messages: List[dict]):
+        conversation_index.record(
+            conv_id,
+            title=title,
+            message_count=len(messages),
+            size=sum(len(m["content"]) for m in messages)
+        )
+
+    def size(self, conv_id: int) -> int:
+        return self._conn().execute(
+            "SELECT COALESCE(SUM(LENGTH(content)), 0) FROM messages WHERE conv_id = ?",
+            (conv_id,)
+        ).fetchone()[0]
+
+    def updated_at(self, conv_id: int) -> float:
+        row = self._conn().execute(
+            "SELECT updated_at FROM conversations WHERE id = ?", (conv_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def save_turn(self, conv_id: int, messages: List[dict], fields: dict):
+        """
+        Persist the client's full message list. When the stored history is
+        a prefix of it, only the new rows are inserted.
+        """
+        conn = self._conn()
+        with conn:
+            self._upsert_row(conn, conv_id, fields)
+            last = conn.execute(
+                "SELECT idx, role, content FROM messages WHERE conv_id = ? "
+                "ORDER BY idx DESC LIMIT 1",
+                (conv_id,)
+            ).fetchone()
+            start = last[0] + 1 if last else 0
+            if last and (
+                start > len(messages)
+                or messages[last[0]] != {"role": last[1], "content": last[2]}
+            ):
+                # History diverged from what we stored; rewrite it
+                conn.execute("DELETE FROM messages WHERE conv_id = ?", (conv_id,))
+                start = 0
+            self._insert_messages(conn, conv_id, start, messages[start:])
+        self._index(conv_id, fields.get("title"), messages)
+
+    def set_fields(self, conv_id: int, fields: dict):
+        if not self.exists(conv_id):
+            return
+        conn = self._conn()
+        with conn:
+            self._upsert_row(conn, conv_id, fields)
+        conversation_index.record(conv_id, title=fields.get("title"))
+
+    def delete(self, conv_id: int):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM messages WHERE conv_id = ?", (conv_id,))
+            conn.execute("DELETE FROM conversations WHERE id = ?", (conv_id,))
+            conn.execute("DELETE FROM conv_memory WHERE conv_id = ?", (conv_id,))
+        conversation_index.remove(conv_id)
+
+    def load_memory(self, conv_id: int, default):
+        row = self._conn().execute(
+            "SELECT data FROM conv_memory WHERE conv_id = ?", (conv_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def save_memory(self, conv_id: int, memory: dict):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO conv_memory (conv_id, data) VALUES (?, ?)",
+                (conv_id, json.dumps(memory))
+            )
+        conversation_index.bump(conv_id)
+
+    def fingerprints(self) -> dict:
+        # Same leaves as snapshot_directory(), with the row revision as hash
+        rows = self._conn().execute(
+            "SELECT c.id, c.revision, COUNT(m.idx) FROM conversations c "
+            "LEFT JOIN messages m ON m.conv_id = c.id GROUP BY c.id"
+        )
+        return build_merkle({
+            f"conv_{conv_id}.json": {"hash": str(revision), "size": count}
+            for conv_id, revision, count in rows
+        })
+
+    def migrate_from_json(self, force: bool = False) -> int:
+        """Import conversations/ and memory/per_conversation/ once."""
+        conn = self._conn()
+        done = conn.execute(
+            "SELECT value FROM store_meta WHERE key = 'json_migrated'"
+        ).fetchone()
+        if done and not force:
+            return 0
+
+        source = JsonConversationStore()
+        imported = 0
+        for conv_id in source.ids():
+            try:
+                data = source.load(conv_id, None)
+            except (OSError, ValueError) as e:
+                logging.error(f"Skipping conv_{conv_id} during migration: {e}")
+                continue
+            if not data:
+                continue
+            self.save(conv_id, data)
+            memory = source.load_memory(conv_id, None)
+            if memory is not None:
+                self.save_memory(conv_id, memory)
+            imported += 1
+
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('json_migrated', ?)",
+                (str(time.time()),)
+            )
+        logging.info(f"Migrated {imported} conversations into {self.path}")
+        return imported
+
+
+class LogConversationStore(JsonConversationStore):
+    """conv_{id}.json snapshot plus conv_{id}.log.jsonl of the ops written since."""
+
+    def __init__(self, compact_bytes: int = LOG_COMPACT_BYTES):
+        super().__init__()
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        # conv_id -> (log stat, message count, last message, last seq)
+        self._tails = {}
+
+    def exists(self, conv_id: int) -> bool:
+        return os.path.exists(conv_path(conv_id)) or os.path.exists(conv_log_path(conv_id))
+
+    def ids(self) -> List[int]:
+        ids = set()
+        for f in os.listdir(CONV_DIR):
+            if f.startswith("conv_") and (f.endswith(".json") or f.endswith(".jsonl")):
+                try:
+                    ids.add(conv_id_from_filename(f))
+                except (ValueError, IndexError):
+                    pass
+        return sorted(ids)
+
+    def _read_log(self, conv_id: int) -> List[dict]:
+        path = conv_log_path(conv_id)
+        if not os.path.exists(path):
+            return []
+        ops = []
+        with open(path, "rb") as f:
+            lines = f.read().split(b"\n")
+        for i, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                ops.append(json.loads(line))
+            except ValueError:
+                if i == len(lines) - 1:
+                    break  # torn last line
+                raise
+        return ops
+
+    def _trim_torn_tail(self, path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+                logging.warning(f"Dropped torn record at end of {path}")
+
+    def _replay(self, conv_id: int):
+        data = load_json(conv_path(conv_id), None)
+        ops = self._read_log(conv_id)
+        if data is None and not ops:
+            return None, 0
+        data = data or {"conversation": conv_id, "messages": []}
+        seq = data.pop("log_seq", 0)
+        for op in ops:
+            if op["seq"] <= seq:
+                continue
+            if op["op"] == "message":
+                data["messages"].append(op["message"])
+            elif op["op"] == "set":
+                data.update(op["fields"])
+            elif op["op"] == "reset":
+                data["messages"] = op["messages"]
+            seq = op["seq"]
+        return data, seq
+
+    def _log_stat(self, conv_id: int):
+        try:
+            st = os.stat(conv_log_path(conv_id))
+            return (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def load(self, conv_id: int, default=None):
+        data, _ = self._replay(conv_id)
+        return default if data is None else data
+
+    def _write_snapshot(self, conv_id: int, data: dict, seq: int):
+        save_json(conv_path(conv_id), dict(store_directory(data), log_seq=seq))
+        log = conv_log_path(conv_id)
+        if os.path.exists(log):
+            os.remove(log)
+        self._tails.pop(conv_id, None)
+        conversation_index.record(
+            conv_id,
+            title=data.get("title"),
+            message_count=len(data.get("messages", [])),
+            size=self.size(conv_id)
+        )
+
+    def save(self, conv_id: int, data: dict):
+        with self._lock:
+            _, seq = self._replay(conv_id)
+            self._write_snapshot(conv_id, data, seq)
+
+    def save_turn(self, conv_id: int, messages: List[dict], fields: dict):
+        with self._lock:
+            tail = self._tails.get(conv_id)
+            if tail is None or tail[0] != self._log_stat(conv_id):
+                self._trim_torn_tail(conv_log_path(conv_id))
+                data, seq = self._replay(conv_id)
+                stored = (data or {}).get("messages", [])
+                tail = (None, len(stored), stored[-1] if stored else None, seq)
+            _, count, last, seq = tail
+
+            ops = []
+            if count > len(messages) or (count and messages[count - 1] != last):
+                # History diverged from what we stored; log a full reset
+                ops.append({"op": "reset", "messages": messages})
+            else:
+                ops.extend({"op": "message", "message": m} for m in messages[count:])
+            if fields:
+                ops.append({"op": "set", "fields": fields})
+
+            with open(conv_log_path(conv_id), "a") as f:
+                for op in ops:
+                    seq += 1
+                    f.write(json.dumps({"seq": seq, **op}) + "\n")
+
+            self._tails[conv_id] = (
+                self._log_stat(conv_id), len(messages),
+                messages[-1] if messages else None, seq
+            )
+            conversation_index.record(
+                conv_id,
+                title=fields.get("title"),
+                message_count=len(messages),
+                size=self.size(conv_id)
+            )
+            if self._log_stat(conv_id)[0] >= self.compact_bytes:
+                self._compact(conv_id)
+
+    def set_fields(self, conv_id: int, fields: dict):
+        with self._lock:
+            if not self.exists(conv_id):
+                return
+            self._trim_torn_tail(conv_log_path(conv_id))
+            _, seq = self._replay(conv_id)
+            with open(conv_log_path(conv_id), "a") as f:
+                f.write(json.dumps({"seq": seq + 1, "op": "set", "fields": fields}) + "\n")
+            self._tails.pop(conv_id, None)
+            conversation_index.record(conv_id, title=fields.get("title"), size=self.size(conv_id))
+
+    def _compact(self, conv_id: int):
+        data, seq = self._replay(conv_id)
+        if data is not None:
+            self._write_snapshot(conv_id, data, seq)
+            logging.info(f"Compacted log for conv_{conv_id} at seq {seq}")
+
+    def delete(self, conv_id: int):
+        with self._lock:
+            super().delete(conv_id)
+            if os.path.exists(conv_log_path(conv_id)):
+                os.remove(conv_log_path(conv_id))
+            self._tails.pop(conv_id, None)
+
+    def fingerprints(self) -> dict:
+        # Fold snapshot + log entries so each conversation appears once
+        folded = {}
+        for name, entry in sorted(snapshot_directory().items()):
+            if not name.startswith("conv_"):
+                continue
+            try:
+                key = f"conv_{conv_id_from_filename(name)}.json"
+            except (ValueError, IndexError):
+                continue
+            prev = folded.get(key, {"hash": "", "size": 0})
+            folded[key] = {
+                "hash": prev["hash"] + entry["hash"],
+                "size": prev["size"] + entry["size"]
+            }
+        return build_merkle(folded)
+
+
+def open_store():
+    if STORAGE_BACKEND == "log":
+        return LogConversationStore()
+    if STORAGE_BACKEND == "sqlite":
+        sqlite_store = SqliteConversationStore(DB_PATH)
+        sqlite_store.migrate_from_json()
+        return sqlite_store
+    return JsonConversationStore()
+
+store = open_store()
+
+if not conversation_index.exists():
+    conversation_index.rebuild(store)
+else:
+    conversation_index.reconcile(store)
+
 # =========================================================
 # Memory Helpers
 # =========================================================
@@ -107,6 +1374,10 @@ def load_global_memory():
         "preferences": {}
     })
 
+def save_global_memory(memory: dict):
+    save_json(GLOBAL_MEMORY_PATH, memory)
+    change_feed.append("global_memory", None, "updated")
+
 import requests
 
 OLLAMA_URL = "http://127.0.0.1:11434/api/generate"
@@ -126,163 +1397,1140 @@ def ollama_generate(prompt, model="llama3"):
 
 
 def load_conv_memory(conv_id: int):
-    return load_json(conv_memory_path(conv_id), {
+    return store.load_memory(conv_id, {
         "summary": "",
         "notes": []
     })
 
+ROLLING_SUMMARY_PROMPT = """
+You maintain the running summary of a conversation. You are given the
+current summary and the messages added since it was written. Return the
+updated summary of the whole conversation: a single, concise paragraph with
+the key facts, user goals, and important decisions. Keep what still holds
+from the current summary.
+"""
+
+def summary_is_current(messages: list, memory: dict) -> bool:
+    """
+    Whether the stored summary covers a prefix of `messages`. The memory
+    records how many messages it covers (summarized_upto) and their digest
+    (summarized_hash), so an edited or reset history is detected.
+    """
+    upto = memory.get("summarized_upto", 0)
+    return (
+        bool(memory.get("summary"))
+        and upto <= len(messages)
+        and memory.get("summarized_hash") == tree_digest(messages[:upto])
+    )
+
+def summary_window(messages: list, memory: dict):
+    """
+    (previous summary, messages to add to it). The previous summary is ""
+    when the conversation has to be summarized from the start.
+    """
+    if SUMMARY_MODE == "incremental" and summary_is_current(messages, memory):
+        return memory["summary"], messages[memory["summarized_upto"]:]
+    return "", messages
+
+def mark_summarized(memory: dict, messages: list):
+    memory["summarized_upto"] = len(messages)
+    memory["summarized_hash"] = tree_digest(messages)
+
+SEGMENT_SUMMARY_PROMPT = """
+Summarize this part of a longer conversation: the key facts, user goals,
+and important decisions it contains, in a single, concise paragraph.
+"""
+
+REDUCE_SUMMARY_PROMPT = """
+You are given summaries of consecutive parts of one conversation, in order.
+Combine them into a single, concise paragraph with the key facts, user
+goals, and important decisions of the whole conversation. Where they
+conflict, later parts take precedence.
+"""
+
+def split_segments(messages: list, budget: int = None) -> List[list]:
+    """
+    Consecutive segments of about `budget` estimated tokens. Segments are
+    filled from the start, so appending messages only ever changes the last
+    one and the others keep their content hash.
+    """
+    budget = SUMMARY_SEGMENT_TOKENS if budget is None else budget
+    segments = []
+    current, used = [], 0
+    for message in messages:
+        tokens = estimate_tokens(message)
+        if current and used + tokens > budget:
+            segments.append(current)
+            current, used = [], 0
+        current.append(message)
+        used += tokens
+    if current:
+        segments.append(current)
+    return segments
+
+def segment_summary_path(digest: str) -> str:
+    return os.path.join(SEGMENT_SUMMARY_DIR, digest[:2], f"{digest}.json")
+
+def summarize_segment(segment: list) -> str:
+    """Summary of one segment, cached by the digest of its messages."""
+    path = segment_summary_path(tree_digest(segment))
+    cached = load_json(path, None)
+    if cached is not None:
+        os.utime(path)  # mark as recently used for prune_segment_summaries
+        return cached["summary"]
+
+    result = background_chat(
+        model="mistral",
+        messages=[
+            {"role": "system", "content": SEGMENT_SUMMARY_PROMPT},
+            {"role": "user", "content": json.dumps(segment)}
+        ]
+    )
+    summary = result["message"]["content"]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    save_json(path, {"summary": summary})
+    return summary
+
+def prune_segment_summaries(limit: int = None):
+    """
+    Keep at most `limit` cached segment summaries. Every turn of a long
+    conversation leaves the summary of its previous tail segment behind, so
+    without this the cache only grows.
+    """
+    limit = SEGMENT_SUMMARY_CACHE_SIZE if limit is None else limit
+    entries = []
+    for root, _, files in os.walk(SEGMENT_SUMMARY_DIR):
+        for name in files:
+            if not name.endswith(".json"):
+                continue  # temp file of a write in progress
+            path = os.path.join(root, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                pass
+    if len(entries) <= limit:
+        return
+    entries.sort()
+    for _, path in entries[:len(entries) - limit]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    logging.info(f"Pruned {len(entries) - limit} cached segment summaries")
+
+def reduce_summaries(summaries: List[str]) -> str:
+    result = background_chat(
+        model="mistral",
+        messages=[
+            {"role": "system", "content": REDUCE_SUMMARY_PROMPT},
+            {"role": "user", "content": json.dumps(summaries)}
+        ]
+    )
+    return result["message"]["content"]
+
+def map_reduce_summary(messages: list) -> str:
+    """
+    Summary of a conversation too long for one prompt. Segment summaries
+    run in parallel on MEMORY_WORKERS threads and come from the cache for
+    every segment but a changed tail; they are then combined, in several
+    rounds if they do not fit in one prompt either.
+    """
+    segments = split_segments(messages)
+    with ThreadPoolExecutor(max_workers=MEMORY_WORKERS) as pool:
+        summaries = list(pool.map(summarize_segment, segments))
+        while len(summaries) > 1:
+            # At least two summaries per group, so every round shrinks the list
+            groups = [[]]
+            for summary in summaries:
+                group = groups[-1]
+                if len(group) >= 2 and estimate_tokens(group + [summary]) > SUMMARY_CONTEXT_TOKENS:
+                    groups.append([summary])
+                else:
+                    group.append(summary)
+            summaries = list(pool.map(
+                lambda group: group[0] if len(group) == 1 else reduce_summaries(group),
+                groups
+            ))
+    logging.info(f"Summarized {len(messages)} messages in {len(segments)} segments")
+    prune_segment_summaries()
+    return summaries[0]
+
 def update_conv_memory(conv_id: int, messages: List[ChatMessage], conv_memory_data: dict = None):
     logging.info(f"Updating conversation memory for conv_{conv_id}")
+    memory = conv_memory_data if conv_memory_data is not None else load_conv_memory(conv_id)
+    messages = [m.dict() for m in messages]
+    previous, new = summary_window(messages, memory)
+
+    if estimate_tokens(new) > SUMMARY_CONTEXT_TOKENS:
+        # Too long for one prompt, e.g. a long history summarized from the start
+        summary = map_reduce_summary(messages)
+    else:
+        if previous:
+            prompt = [
+                {
+                    "role": "system",
+                    "content": ROLLING_SUMMARY_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": json.dumps({"summary": previous, "new_messages": new})
+                }
+            ]
+        else:
+            prompt = [
+                {
+                    "role": "system",
+                    "content": "Summarize the key facts, user goals, and important decisions from the entire conversation. The summary should be a single, concise paragraph."
+                },
+                {
+                    "role": "user",
+                    "content": json.dumps(messages)
+                }
+            ]
+
+        result = background_chat(
+            model="mistral",
+            messages=prompt
+        )
+        summary = result["message"]["content"]
+
+    # Reload: notes may have been added while the model was busy
+    with memory_lock:
+        memory = load_conv_memory(conv_id)
+        memory["summary"] = summary
+        mark_summarized(memory, messages)
+        store.save_memory(conv_id, memory)
+    logging.info(f"Finished updating conversation memory for conv_{conv_id}")
+
+def summary_delay(conv_id: int, messages: list, memory: dict):
+    """
+    Seconds until the summary of a conversation is due: 0 when enough turns
+    or tokens were added since the last one (or there is no current one),
+    None when nothing was added at all, else the rest of the idle period.
+    """
+    if not summary_is_current(messages, memory):
+        return 0
+    new = messages[memory["summarized_upto"]:]
+    if not new:
+        return None
+    turns = sum(1 for m in new if m["role"] == "user")
+    if turns >= SUMMARY_EVERY_TURNS or estimate_tokens(new) >= SUMMARY_TOKEN_GROWTH:
+        return 0
+    idle = time.time() - store.updated_at(conv_id)
+    return max(0.0, SUMMARY_IDLE_SECONDS - idle)
+
+
+EXTRACTION_PROMPT = """
+Analyze the conversation and extract user facts and preferences.
+Return JSON ONLY:
+{
+  "facts": [string],
+  "preferences": { key: value }
+}
+If none, return empty structures.
+"""
+
+def extract_memory(messages: list) -> dict:
     prompt = [
         {
             "role": "system",
-            "content": "Summarize the key facts, user goals, and important decisions from the entire conversation. The summary should be a single, concise paragraph."
+            "content": EXTRACTION_PROMPT
         },
         {
             "role": "user",
-            "content": json.dumps([m.dict() for m in messages])
+            "content": json.dumps(messages)
         }
     ]
 
-    result = ollama.chat(
+    result = background_chat(
         model="mistral",
-        messages=prompt
+        messages=prompt,
+        format="json"
     )
 
-    memory = conv_memory_data if conv_memory_data is not None else load_conv_memory(conv_id)
-    memory["summary"] = result["message"]["content"]
-
-    with memory_lock:
-        save_json(conv_memory_path(conv_id), memory)
-    logging.info(f"Finished updating conversation memory for conv_{conv_id}")
-
-
-def update_global_memory_full_scan():
-    logging.info("Rebuilding global memory from all conversations.")
-
-    all_facts = set()
-    all_preferences = {}
-
-    for conv_file in os.listdir(CONV_DIR):
-        if not conv_file.startswith("conv_") or not conv_file.endswith(".json"):
-            continue
+    return clean_extraction(json.loads(result["message"]["content"]))
 
-        conv_data = load_json(os.path.join(CONV_DIR, conv_file), None)
-        if not conv_data or not conv_data.get("messages"):
-            continue
+def clean_extraction(extracted: dict) -> dict:
+    preferences = extracted.get("preferences", {})
+    return {
+        "facts": [f for f in extracted.get("facts", []) if isinstance(f, str)],
+        "preferences": preferences if isinstance(preferences, dict) else {}
+    }
 
-        prompt = [
-            {
-                "role": "system",
-                "content": """
-Analyze the conversation and extract user facts and preferences.
-Return JSON ONLY:
+BATCH_EXTRACTION_PROMPT = """
+You are given several conversations as a JSON object keyed by conversation id.
+Analyze each conversation separately and extract user facts and preferences.
+Return JSON ONLY, with one entry for every conversation id:
 {
-  "facts": [string],
-  "preferences": { key: value }
+  "<conversation id>": {
+    "facts": [string],
+    "preferences": { key: value }
+  }
 }
-If none, return empty structures.
+If a conversation has none, return empty structures for it.
 """
-            },
-            {
-                "role": "user",
-                "content": json.dumps(conv_data["messages"])
-            }
-        ]
 
+def estimate_tokens(messages: list) -> int:
+    # Roughly four characters per token for English text
+    return len(json.dumps(messages)) // 4
+
+def extract_memory_batch(batch: dict) -> dict:
+    """
+    One request for {conv_id: messages}. Returns {conv_id: extracted} for
+    the ids the model answered with a well-formed entry; callers fall back
+    to extract_memory for the rest.
+    """
+    prompt = [
+        {
+            "role": "system",
+            "content": BATCH_EXTRACTION_PROMPT
+        },
+        {
+            "role": "user",
+            "content": json.dumps({str(conv_id): messages for conv_id, messages in batch.items()})
+        }
+    ]
+
+    result = background_chat(
+        model="mistral",
+        messages=prompt,
+        format="json"
+    )
+
+    answered = json.loads(result["message"]["content"])
+    if not isinstance(answered, dict):
+        return {}
+    extracted = {}
+    for conv_id in batch:
+        entry = answered.get(str(conv_id))
+        if isinstance(entry, dict) and isinstance(entry.get("facts", []), list):
+            extracted[conv_id] = clean_extraction(entry)
+    return extracted
+
+def pack_extraction_batches(pending: dict, budget: int = None) -> List[dict]:
+    """
+    Split {conv_id: messages} into groups whose estimated size fits the
+    token budget. Conversations over the budget get a group of their own.
+    """
+    budget = EXTRACTION_BATCH_TOKENS if budget is None else budget
+    if budget <= 0:
+        return [{conv_id: messages} for conv_id, messages in pending.items()]
+
+    groups = []
+    current, used = {}, 0
+    for conv_id, messages in sorted(pending.items(), key=lambda kv: estimate_tokens(kv[1])):
+        tokens = estimate_tokens(messages)
+        if current and used + tokens > budget:
+            groups.append(current)
+            current, used = {}, 0
+        current[conv_id] = messages
+        used += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def extract_group(group: dict) -> dict:
+    """
+    Extract one packed group. A single conversation maps to its result, or
+    None on failure. For a batch, ids missing from the result could not be
+    read from the batched answer and should be retried on their own.
+    """
+    if len(group) > 1:
         try:
-            result = ollama.chat(
-                model="mistral",
-                messages=prompt,
-                format="json"
-            )
+            return extract_memory_batch(group)
+        except Exception as e:
+            logging.error(f"Batched extraction of {sorted(group)} failed, retrying one by one: {e}")
+            return {}
+
+    (conv_id, messages), = group.items()
+    if stop_event is not None and stop_event.is_set():
+        return {conv_id: None}
+    try:
+        return {conv_id: extract_memory(messages)}
+    except Exception as e:
+        logging.error(f"Memory extraction failed for conv_{conv_id}.json: {e}")
+        return {conv_id: None}
 
-            extracted = json.loads(result["message"]["content"])
+# =========================================================
+# Memory Provenance
+# =========================================================
+#
+# provenance.json records what each conversation contributed to global
+# memory, plus facts added by hand through POST /memory/global:
+#
+#     {"conversations": {"3": {"hash": ..., "facts": [...], "preferences": {...}}},
+#      "manual": [...]}
+#
+# global.json is always the merge of it, so a removed conversation is
+# retracted by dropping its entry and re-merging, without re-extracting
+# anything. "hash" is the digest of the messages the entry was extracted
+# from; while it matches, the entry doubles as the extraction cache.
+
+def load_provenance() -> dict:
+    return load_json(PROVENANCE_PATH, {"conversations": {}, "manual": []})
+
+def merge_global_memory(provenance: dict) -> dict:
+    facts = set(provenance["manual"])
+    preferences = {}
+    # Newer conversations win preference conflicts
+    for conv_id in sorted(provenance["conversations"], key=int):
+        extracted = provenance["conversations"][conv_id]
+        facts.update(extracted["facts"])
+        preferences.update(extracted["preferences"])
+    return {"facts": sorted(facts), "preferences": preferences}
+
+def save_provenance(provenance: dict):
+    """Caller holds memory_lock."""
+    save_json(PROVENANCE_PATH, provenance)
+    save_global_memory(merge_global_memory(provenance))
+
+def retract_conversations(conv_ids: List[int]):
+    with memory_lock:
+        provenance = load_provenance()
+        removed = [
+            conv_id for conv_id in conv_ids
+            if provenance["conversations"].pop(str(conv_id), None) is not None
+        ]
+        if removed:
+            save_provenance(provenance)
+    if removed:
+        logging.info(f"Retracted global memory from removed conversations: {removed}")
 
-            for fact in extracted.get("facts", []):
-                all_facts.add(fact)
+def update_global_memory_full_scan():
+    """
+    Unchanged conversations reuse their cached extraction; the rest are
+    packed into batches (see pack_extraction_batches) that run on
+    MEMORY_WORKERS threads, bounded by ollama_slots. Each extraction is
+    checkpointed in job_store as it completes, so a scan interrupted by a
+    restart only redoes the conversations it had not reached.
+    """
+    logging.info("Rebuilding global memory from all conversations.")
 
-            for k, v in extracted.get("preferences", {}).items():
-                all_preferences[k] = v
+    with memory_lock:
+        previous = load_provenance()
+    contributions = {}
+    pending = {}
+    digests = {}
+    processed = reused = failed = 0
+    conv_ids = store.ids()
+    set_rebuild_status(
+        state="running", total=len(conv_ids), processed=0, reused=0, failed=0,
+        started_at=time.time(), finished_at=None
+    )
 
-        except Exception as e:
-            logging.error(f"Memory extraction failed for {conv_file}: {e}")
+    for conv_id in conv_ids:
+        conv_data = store.load(conv_id, None)
+        messages = (conv_data or {}).get("messages")
+        if not messages:
+            processed += 1
+            continue
+        digest = tree_digest(messages)
+        cached = previous["conversations"].get(str(conv_id))
+        if not (cached and cached.get("hash") == digest):
+            # Extracted by an earlier, interrupted scan
+            cached = job_store.result(("extract", conv_id), digest)
+        if cached is not None:
+            contributions[str(conv_id)] = cached
+            processed += 1
+            reused += 1
+        else:
+            pending[conv_id] = messages
+            digests[conv_id] = digest
+    set_rebuild_status(processed=processed, reused=reused)
+
+    groups = pack_extraction_batches(pending)
+    if pending:
+        logging.info(f"Extracting memory from {len(pending)} conversations in {len(groups)} requests.")
+
+    with ThreadPoolExecutor(max_workers=MEMORY_WORKERS) as pool:
+        futures = {pool.submit(extract_group, group): group for group in groups}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                group = futures.pop(future)
+                results = future.result()
+                for conv_id in group.keys() - results.keys():
+                    # Not answered in the batch; fall back to its own request
+                    retry = {conv_id: group[conv_id]}
+                    futures[pool.submit(extract_group, retry)] = retry
+                for conv_id, extracted in results.items():
+                    processed += 1
+                    if extracted is not None:
+                        entry = dict(extracted, hash=digests[conv_id])
+                        contributions[str(conv_id)] = entry
+                        job_store.finish(("extract", conv_id), digests[conv_id], {}, result=entry)
+                    else:
+                        failed += 1
+                        # Keep what this conversation contributed last time
+                        if str(conv_id) in previous["conversations"]:
+                            contributions[str(conv_id)] = previous["conversations"][str(conv_id)]
+                set_rebuild_status(processed=processed, reused=reused, failed=failed)
+
+    if stop_event is not None and stop_event.is_set():
+        set_rebuild_status(state="cancelled", finished_at=time.time())
+        logging.info("Global memory rebuild cancelled.")
+        return
 
     with memory_lock:
-        save_json(GLOBAL_MEMORY_PATH, {
-            "facts": sorted(all_facts),
-            "preferences": all_preferences
-        })
+        # Requests and jobs kept running during the scan: skip conversations
+        # deleted since, and entries rewritten since the scan read them
+        provenance = load_provenance()
+        live = {str(conv_id) for conv_id in store.ids()}
+        current = provenance["conversations"]
+        for conv_id in list(current):
+            if conv_id not in live:
+                del current[conv_id]
+        for conv_id, entry in contributions.items():
+            if conv_id in live and current.get(conv_id) == previous["conversations"].get(conv_id):
+                current[conv_id] = entry
+        save_provenance(provenance)
+    # provenance.json holds them now
+    job_store.clear_results("extract")
+
+    set_rebuild_status(state="done", finished_at=time.time())
+    logging.info(
+        f"Global memory rebuild complete "
+        f"({reused} of {len(contributions)} conversations unchanged)."
+    )
 
-    logging.info("Global memory rebuild complete.")
+def process_changed_conversation(conv_file: str):
+    try:
+        conv_id = conv_id_from_filename(conv_file)
+    except (ValueError, IndexError) as e:
+        logging.error(f"Could not process {conv_file}: {e}")
+        return
+    # Global memory is only re-extracted by the startup scan; a full-history
+    # extraction per turn would double the model load of active chats
+    job_queue.submit("summary", conv_id)
+
+def process_changed_conversations(changed_conv_files: List[str]):
+    logging.info(f"Detected changes in conversations: {changed_conv_files}")
+
+    # Update per-conversation summaries for modified/added conversations;
+    # the job queue coalesces these with the jobs queued by /chat
+    for conv_file in changed_conv_files:
+        process_changed_conversation(conv_file)
+
+def retract_removed_conversations(removed_conv_files: List[str]):
+    conv_ids = []
+    for conv_file in removed_conv_files:
+        try:
+            conv_ids.append(conv_id_from_filename(conv_file))
+        except (ValueError, IndexError):
+            logging.error(f"Could not process removed {conv_file}")
+    retract_conversations(conv_ids)
 
-def background_memory_update():
-    logging.info("Background memory updater started.")
-    last_snapshot = snapshot_directory()
+def poll_memory_update():
+    last_snapshot = store.fingerprints()
     while not stop_event.is_set():
         try:
             if not memory_lock.locked():
-                current_snapshot = snapshot_directory()
+                current_snapshot = store.fingerprints()
                 diff = diff_snapshots(last_snapshot, current_snapshot)
 
                 changed_conv_files = []
                 # Combine added and modified files for global memory update
                 changed_conv_files.extend(diff["added"])
                 changed_conv_files.extend(diff["modified"])
-                
+
                 if changed_conv_files:
-                    logging.info(f"Detected changes in conversations: {changed_conv_files}")
-                    # Update global memory only with changed conversations
-                    
-                    # Update per-conversation summaries for modified/added conversations
-                    for conv_file in changed_conv_files:
-                        if stop_event.is_set():
-                            break # Exit if stop event is set during processing
-                        
-                        try:
-                            conv_id = int(conv_file.split("_")[1].split(".")[0])
-                            conv_data = load_json(os.path.join(CONV_DIR, conv_file), {})
-                            if conv_data.get("messages"):
-                                conv_memory_data = load_json(conv_memory_path(conv_id), {
-                                    "summary": "",
-                                    "notes": []
-                                })
-                                update_conv_memory(conv_id, [ChatMessage(**msg) for msg in conv_data["messages"]], conv_memory_data)
-                                time.sleep(1) # Small delay to distribute workload
-                        except (ValueError, IndexError) as e:
-                            logging.error(f"Could not process {conv_file}: {e}")
-                        except Exception as e:
-                            logging.error(f"An unexpected error occurred while processing {conv_file}: {e}")
+                    process_changed_conversations(changed_conv_files)
+                if diff["removed"]:
+                    retract_removed_conversations(diff["removed"])
 
                 last_snapshot = current_snapshot
 
         except Exception as e:
             logging.error(f"Error in background memory update loop: {e}")
-        
+
         # Wait for a while before the next run, or until the stop event is set
         stop_event.wait(60) # Check for changes every 60 seconds
+
+def watch_memory_update(events: queue.Queue):
+    """
+    Consume watcher events. A file is processed once no new event for it has
+    arrived for WATCH_DEBOUNCE seconds; a None event (watcher overflow)
+    triggers a full snapshot diff instead.
+    """
+    last_snapshot = store.fingerprints()
+    pending = {}  # conv file (or None) -> monotonic time of last event
+    while not stop_event.is_set():
+        # Wake up when the oldest pending entry is due, so a busy file does
+        # not hold back the others
+        if pending:
+            timeout = max(0.0, min(pending.values()) + WATCH_DEBOUNCE - time.monotonic())
+        else:
+            timeout = 1.0
+        try:
+            name = events.get(timeout=timeout)
+            if name is None:
+                pending[None] = time.monotonic()
+            elif name.startswith("conv_"):
+                # Fold log/snapshot files of the log store into one key
+                pending[f"conv_{conv_id_from_filename(name)}.json"] = time.monotonic()
+        except queue.Empty:
+            pass
+        except (ValueError, IndexError):
+            pass
+
+        now = time.monotonic()
+        due = [n for n, t in pending.items() if now - t >= WATCH_DEBOUNCE]
+        if not due:
+            continue
+        for n in due:
+            del pending[n]
+
+        try:
+            current_snapshot = store.fingerprints()
+            if None in due:
+                diff = diff_snapshots(last_snapshot, current_snapshot)
+                changed_conv_files = diff["added"] + diff["modified"]
+                removed_conv_files = diff["removed"]
+            else:
+                changed_conv_files = [
+                    n for n in due if snapshot_entry(current_snapshot, n) is not None
+                ]
+                removed_conv_files = [
+                    n for n in due if snapshot_entry(current_snapshot, n) is None
+                ]
+            last_snapshot = current_snapshot
+            if changed_conv_files:
+                process_changed_conversations(changed_conv_files)
+            if removed_conv_files:
+                retract_removed_conversations(removed_conv_files)
+        except Exception as e:
+            logging.error(f"Error in background memory update loop: {e}")
+
+def background_memory_update():
+    logging.info("Background memory updater started.")
+    watcher = start_conversation_watcher()
+    if watcher is not None:
+        logging.info("Watching conversations with inotify.")
+        watch_memory_update(watcher.events)
+    else:
+        poll_memory_update()
     logging.info("Background memory updater stopped.")
 
+# =========================================================
+# Background Jobs
+# =========================================================
+
+# Lower runs first: follow-ups of a chat turn go ahead of watcher events
+PRIORITY_CHAT = 0
+PRIORITY_BACKGROUND = 1
+
+def summarize_conversation(conv_id: int, messages: list, title: bool = False, force: bool = False):
+    """
+    Refresh the summary when summary_delay says it is due, returning the
+    delay otherwise. The title is generated along with the first summary
+    and then kept, unless `force` asks for a new one.
+    """
+    memory = load_conv_memory(conv_id)
+    if not force:
+        delay = summary_delay(conv_id, messages, memory)
+        if delay is None:
+            return None
+        if delay > 0:
+            return delay
+
+    if not (title and (force or not memory.get("titled"))):
+        update_conv_memory(conv_id, [ChatMessage(**m) for m in messages], memory)
+        return None
+    previous, new = summary_window(messages, memory)
+    if estimate_tokens(new) > SUMMARY_CONTEXT_TOKENS:
+        # Title the combined summary of the segments
+        previous, new = map_reduce_summary(messages), []
+    meta = generate_title_and_summary(new, previous)
+    store.set_fields(conv_id, {"title": meta["title"]})
+    with memory_lock:
+        memory = load_conv_memory(conv_id)
+        memory["summary"] = meta["summary"]
+        mark_summarized(memory, messages)
+        memory["titled"] = True
+        store.save_memory(conv_id, memory)
+    return None
+
+JOB_HANDLERS = {
+    "summary": summarize_conversation,
+}
+
+class JobStore:
+    """Durable background job state, one row per (kind, conversation id)."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        kind TEXT NOT NULL,
+        conv_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 1,
+        options TEXT NOT NULL DEFAULT '{}',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        input_hash TEXT,
+        done_options TEXT,
+        result TEXT,
+        updated_at REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (kind, conv_id)
+    );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, key, priority: int, options: dict):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (kind, conv_id, status, priority, options, updated_at) "
+                "VALUES (?, ?, 'pending', ?, ?, ?) ON CONFLICT(kind, conv_id) DO UPDATE SET "
+                "status = 'pending', priority = excluded.priority, options = excluded.options, "
+                "attempts = 0, updated_at = excluded.updated_at",
+                (*key, priority, json.dumps(options), time.time())
+            )
+
+    def start(self, key) -> int:
+        """Mark the job running and return how many times it has been started."""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                "WHERE kind = ? AND conv_id = ?",
+                (time.time(), *key)
+            )
+            row = conn.execute(
+                "SELECT attempts FROM jobs WHERE kind = ? AND conv_id = ?", key
+            ).fetchone()
+        return row[0] if row else 1
+
+    def finish(self, key, input_hash: str, options: dict, result: dict = None):
+        # A job submitted again while it ran stays pending
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (kind, conv_id, status, input_hash, done_options, result, updated_at) "
+                "VALUES (?, ?, 'done', ?, ?, ?, ?) ON CONFLICT(kind, conv_id) DO UPDATE SET "
+                "status = CASE status WHEN 'pending' THEN 'pending' ELSE 'done' END, "
+                "input_hash = excluded.input_hash, done_options = excluded.done_options, "
+                "result = excluded.result, updated_at = excluded.updated_at",
+                (*key, input_hash, json.dumps(options),
+                 json.dumps(result) if result is not None else None, time.time())
+            )
+
+    def fail(self, key, retry: bool):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? "
+                "WHERE kind = ? AND conv_id = ? AND status = 'running'",
+                ("pending" if retry else "failed", time.time(), *key)
+            )
+
+    def defer(self, key):
+        """Back to pending without counting the run as an attempt."""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = attempts - 1, updated_at = ? "
+                "WHERE kind = ? AND conv_id = ? AND status = 'running'",
+                (time.time(), *key)
+            )
+
+    def forget(self, key):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM jobs WHERE kind = ? AND conv_id = ?", key)
+
+    def is_done(self, key, input_hash: str, options: dict) -> bool:
+        """Whether `input_hash` was already processed with (at least) `options`."""
+        row = self._conn().execute(
+            "SELECT input_hash, done_options FROM jobs WHERE kind = ? AND conv_id = ?", key
+        ).fetchone()
+        if row is None or row[0] != input_hash:
+            return False
+        return options.items() <= json.loads(row[1] or "{}").items()
+
+    def result(self, key, input_hash: str):
+        row = self._conn().execute(
+            "SELECT result FROM jobs WHERE kind = ? AND conv_id = ? AND input_hash = ?",
+            (*key, input_hash)
+        ).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def clear_results(self, kind: str):
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET result = NULL WHERE kind = ?", (kind,))
+
+    def unfinished(self) -> list:
+        rows = self._conn().execute(
+            "SELECT kind, conv_id, priority, options FROM jobs "
+            "WHERE status IN ('pending', 'running') ORDER BY priority, updated_at"
+        ).fetchall()
+        return [((kind, conv_id), priority, json.loads(options)) for kind, conv_id, priority, options in rows]
+
+    def counts(self) -> dict:
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+job_store = JobStore(JOBS_DB_PATH)
+
+class JobQueue:
+    """Background LLM jobs per (kind, conversation id); resubmitting supersedes the pending job."""
+
+    def __init__(self, workers: int, jobs: JobStore):
+        self.workers = workers
+        self.jobs = jobs
+        self._cond = threading.Condition()
+        self._heap = []      # (priority, seq, key); stale entries are skipped
+        self._delayed = []   # (run_at, seq, key) of jobs that wait until run_at
+        self._pending = {}   # key -> (priority, seq, options, run_at)
+        self._running = set()
+        self._seq = itertools.count()
+        self._threads = []
+        self._stopping = False
+
+    def submit(self, kind: str, conv_id: int, priority: int = PRIORITY_BACKGROUND, **options):
+        key = (kind, conv_id)
+        with self._cond:
+            priority, options = self._enqueue(key, priority, options)
+            self.jobs.submit(key, priority, options)
+
+    def _enqueue(self, key, priority: int, options: dict, delay: float = 0):
+        """Caller holds self._cond."""
+        current = self._pending.get(key)
+        if current is not None:
+            priority = min(priority, current[0])
+            options = {**current[2], **options}
+        run_at = time.monotonic() + delay
+        if current is not None:
+            run_at = min(run_at, current[3])
+        seq = next(self._seq)
+        self._pending[key] = (priority, seq, options, run_at)
+        self._push(key)
+        return priority, options
+
+    def _push(self, key):
+        """Caller holds self._cond."""
+        priority, seq, _, run_at = self._pending[key]
+        if run_at > time.monotonic():
+            heapq.heappush(self._delayed, (run_at, seq, key))
+        else:
+            heapq.heappush(self._heap, (priority, seq, key))
+        self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _next(self):
+        with self._cond:
+            while not self._stopping:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, seq, key = heapq.heappop(self._delayed)
+                    job = self._pending.get(key)
+                    if job is not None and job[1] == seq:
+                        heapq.heappush(self._heap, (job[0], seq, key))
+                while self._heap:
+                    _, seq, key = heapq.heappop(self._heap)
+                    job = self._pending.get(key)
+                    if job is None or job[1] != seq or key in self._running:
+                        # Superseded, or re-queued once the running job is done
+                        continue
+                    del self._pending[key]
+                    self._running.add(key)
+                    return key, job[2]
+                self._cond.wait(self._delayed[0][0] - now if self._delayed else None)
+            return None
+
+    def _finish(self, key):
+        with self._cond:
+            self._running.discard(key)
+            if key in self._pending:
+                self._push(key)
+
+    def _run(self, key, options: dict):
+        kind, conv_id = key
+        messages = store.load(conv_id, {}).get("messages")
+        if not messages:
+            self.jobs.forget(key)
+            return
+        digest = tree_digest(messages)
+        if options.get("force") or not self.jobs.is_done(key, digest, options):
+            delay = JOB_HANDLERS[kind](conv_id, messages, **options)
+            if delay:
+                return delay
+        self.jobs.finish(key, digest, options)
+
+    def _work(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            key, options = item
+            attempts = 0
+            try:
+                attempts = self.jobs.start(key)
+                if attempts > JOB_MAX_ATTEMPTS:
+                    # Interrupted that often, e.g. it keeps crashing the process
+                    logging.error(f"Giving up on {key[0]} job for conv_{key[1]} after {attempts - 1} attempts")
+                    self.jobs.fail(key, retry=False)
+                    continue
+                delay = self._run(key, options)
+                if delay:
+                    self.jobs.defer(key)
+                    with self._cond:
+                        self._enqueue(key, PRIORITY_BACKGROUND, options, delay)
+            except Exception as e:
+                retry = attempts < JOB_MAX_ATTEMPTS
+                logging.error(f"{key[0]} job for conv_{key[1]} failed (attempt {attempts}): {e}")
+                self.jobs.fail(key, retry)
+                if retry:
+                    with self._cond:
+                        self._enqueue(key, PRIORITY_BACKGROUND, options)
+            finally:
+                self._finish(key)
+
+    def start(self):
+        with self._cond:
+            self._stopping = False
+            resumed = []
+            for key, priority, options in self.jobs.unfinished():
+                if key[0] not in JOB_HANDLERS:
+                    self.jobs.forget(key)  # a kind of job that no longer exists
+                    continue
+                self._enqueue(key, priority, options)
+                resumed.append(key)
+        if resumed:
+            logging.info(f"Resuming {len(resumed)} background jobs from the last run.")
+        self._threads = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        """Finish the jobs in progress; pending ones resume on the next start."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+job_queue = JobQueue(MEMORY_WORKERS, job_store)
+
 # =========================================================
 # Filesystem Tracking
 # =========================================================
 
-def file_hash(path: str) -> str:
+def new_hasher(algorithm: str = None):
+    algorithm = algorithm or HASH_ALGORITHM
+    if algorithm == "xxhash":
+        return xxhash.xxh3_128()
+    if algorithm == "md5":
+        return hashlib.md5()
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=16)
+    raise ValueError(f"Unknown hash algorithm: {algorithm}")
+
+def file_hash(path: str, algorithm: str = None) -> str:
+    """Streamed in HASH_CHUNK_SIZE blocks, so large files are never held in memory."""
+    hasher = new_hasher(algorithm)
     with open(path, "rb") as f:
-        return hashlib.md5(f.read()).hexdigest()
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def benchmark_file_hash(path: str, repeat: int = 5) -> dict:
+    """Best-of-`repeat` MB/s for the legacy whole-file MD5 and each chunked hasher."""
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+
+    def legacy_md5():
+        with open(path, "rb") as f:
+            hashlib.md5(f.read()).hexdigest()
+
+    candidates = {"md5 (whole file)": legacy_md5}
+    for algorithm in ["md5", "blake2b"] + (["xxhash"] if xxhash else []):
+        candidates[f"{algorithm} (chunked)"] = lambda a=algorithm: file_hash(path, a)
+
+    results = {}
+    for name, fn in candidates.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        results[name] = size_mb / best if best else float("inf")
+    return results
+
+# name -> {"stat": [mtime_ns, size, inode], "hash": ..., "hashed_at": ns}
+snapshot_cache = None
+snapshot_cache_lock = threading.Lock()
+
+# A file changed within this window of being hashed could have been changed
+# again without a visible mtime change, so its cached hash is not trusted
+RACY_WINDOW_NS = 1_000_000_000
 
 def snapshot_directory() -> dict:
-    snap = {}
-    for f in os.listdir(CONV_DIR):
-        path = os.path.join(CONV_DIR, f)
-        if os.path.isfile(path):
-            snap[f] = {
-                "hash": file_hash(path),
-                "size": os.path.getsize(path)
-            }
+    """
+    {name: {"hash", "size"}} for every file in CONV_DIR. Files whose
+    (mtime_ns, size, inode) match the cached stat reuse the cached hash; only
+    new or changed files are read. The cache is persisted in STATE_DIR so a
+    restart does not rehash all history.
+    """
+    global snapshot_cache
+    with snapshot_cache_lock:
+        if snapshot_cache is None:
+            persisted = load_json(SNAPSHOT_CACHE_PATH, {})
+            # Hashes from a different algorithm are not comparable
+            same_algorithm = persisted.get("algorithm") == HASH_ALGORITHM
+            snapshot_cache = persisted.get("files", {}) if same_algorithm else {}
+
+        snap = {}
+        fresh = {}
+        dirty = False
+        for entry in os.scandir(CONV_DIR):
+            if entry.name.endswith(".tmp"):
+                continue  # in-flight save_json
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                stat_key = [st.st_mtime_ns, st.st_size, st.st_ino]
+                cached = snapshot_cache.get(entry.name)
+                if (
+                    cached
+                    and cached["stat"] == stat_key
+                    and st.st_mtime_ns < cached["hashed_at"] - RACY_WINDOW_NS
+                ):
+                    fresh[entry.name] = cached
+                else:
+                    fresh[entry.name] = {
+                        "stat": stat_key,
+                        "hash": file_hash(entry.path),
+                        "hashed_at": time.time_ns()
+                    }
+                    dirty = True
+            except FileNotFoundError:
+                continue  # removed while scanning
+            snap[entry.name] = {"hash": fresh[entry.name]["hash"], "size": st.st_size}
+
+        if dirty or fresh.keys() != snapshot_cache.keys():
+            snapshot_cache = fresh
+            save_json(SNAPSHOT_CACHE_PATH, {"algorithm": HASH_ALGORITHM, "files": fresh})
     return snap
 
-def diff_snapshots(old: dict, new: dict) -> dict:
+class InotifyWatcher:
+    """Per-file change events for one directory via inotify (ctypes, no extra dependency)."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_DELETE
+        if libc.inotify_add_watch(self.fd, path.encode(), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {path}")
+        self.events = queue.Queue()
+
+    def run(self, stop: threading.Event):
+        try:
+            while not stop.is_set():
+                ready, _, _ = select.select([self.fd], [], [], 1.0)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                    offset += self.EVENT_HEADER.size
+                    name = data[offset:offset + length].rstrip(b"\0").decode()
+                    offset += length
+                    if mask & self.IN_Q_OVERFLOW:
+                        self.events.put(None)
+                    elif name and not name.endswith(".tmp"):
+                        self.events.put(name)
+        finally:
+            os.close(self.fd)
+
+
+def start_conversation_watcher():
+    """An InotifyWatcher on CONV_DIR, or None when polling should be used."""
+    if WATCH_MODE == "poll" or STORAGE_BACKEND == "sqlite":
+        return None
+    try:
+        watcher = InotifyWatcher(CONV_DIR)
+    except (OSError, AttributeError) as e:
+        if WATCH_MODE == "inotify":
+            raise
+        logging.info(f"inotify unavailable ({e}), falling back to polling.")
+        return None
+    threading.Thread(target=watcher.run, args=(stop_event,), daemon=True).start()
+    return watcher
+
+# Merkle snapshots group files into 16 ** SNAPSHOT_BUCKET_CHARS buckets by
+# a hash of their name:
+#
+#     {"root": h, "buckets": {"3f": {"hash": h, "files": {name: entry}}}}
+#
+# A bucket hash covers its files and the root covers the bucket hashes,
+# so two snapshots are diffed by descending only into buckets that differ.
+SNAPSHOT_BUCKET_CHARS = 2
+
+def tree_digest(obj) -> str:
+    encoded = json.dumps(obj, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+def snapshot_bucket(name: str) -> str:
+    return hashlib.blake2b(name.encode(), digest_size=8).hexdigest()[:SNAPSHOT_BUCKET_CHARS]
+
+def is_merkle(snap: dict) -> bool:
+    return "root" in snap and "buckets" in snap
+
+def build_merkle(flat: dict) -> dict:
+    grouped = {}
+    for name, entry in flat.items():
+        grouped.setdefault(snapshot_bucket(name), {})[name] = entry
+    buckets = {
+        key: {"hash": tree_digest(files), "files": files}
+        for key, files in grouped.items()
+    }
+    return {
+        "root": tree_digest({key: b["hash"] for key, b in buckets.items()}),
+        "buckets": buckets
+    }
+
+def flatten_snapshot(snap: dict) -> dict:
+    if not is_merkle(snap):
+        return snap
+    flat = {}
+    for bucket in snap["buckets"].values():
+        flat.update(bucket["files"])
+    return flat
+
+def snapshot_entry(snap: dict, name: str):
+    if not is_merkle(snap):
+        return snap.get(name)
+    bucket = snap["buckets"].get(snapshot_bucket(name))
+    return bucket["files"].get(name) if bucket else None
+
+def diff_flat(old: dict, new: dict) -> dict:
     return {
         "added": list(new.keys() - old.keys()),
         "removed": list(old.keys() - new.keys()),
@@ -292,49 +2540,66 @@ def diff_snapshots(old: dict, new: dict) -> dict:
         ]
     }
 
+def diff_snapshots(old: dict, new: dict) -> dict:
+    """Accepts flat or Merkle snapshots; flat ones are converted first."""
+    if not is_merkle(old):
+        old = build_merkle(old)
+    if not is_merkle(new):
+        new = build_merkle(new)
+
+    diff = {"added": [], "removed": [], "modified": []}
+    if old["root"] == new["root"]:
+        return diff
+    for key in old["buckets"].keys() | new["buckets"].keys():
+        a = old["buckets"].get(key)
+        b = new["buckets"].get(key)
+        if a and b and a["hash"] == b["hash"]:
+            continue
+        part = diff_flat(a["files"] if a else {}, b["files"] if b else {})
+        for kind in diff:
+            diff[kind].extend(part[kind])
+    return diff
+
 # =========================================================
 # Ollama Streaming
 # =========================================================
 
 def ollama_stream(messages: List[dict]):
-    response = ollama.chat(
-        model="mistral",
-        messages=messages,
-        stream=True
-    )
-    for chunk in response:
-        if "message" in chunk and "content" in chunk["message"]:
-            yield chunk["message"]["content"]
+    with ollama_slots.interactive():
+        response = ollama.chat(
+            model="mistral",
+            messages=messages,
+            stream=True
+        )
+        for chunk in response:
+            if "message" in chunk and "content" in chunk["message"]:
+                yield chunk["message"]["content"]
 
 # =========================================================
 # Core Helpers
 # =========================================================
 
 def next_conversation_id() -> int:
-    ids = []
-    for f in os.listdir(CONV_DIR):
-        if f.startswith("conv_"):
-            try:
-                ids.append(int(f.split("_")[1].split(".")[0]))
-            except:
-                pass
-    return max(ids) + 1 if ids else 0
+    return store.allocate_id()
 
 def save_conversation(data: ChatRequest):
-    path = conv_path(data.conversation)
-    old_data = load_json(path, {})
+    old_data = resolve_directory(store.load(data.conversation, {}))
     old_dir = old_data.get("directory", {})
 
-    new_dir = snapshot_directory()
+    new_dir = build_merkle(snapshot_directory())
 
-    save_json(path, {
+    store.save(data.conversation, {
         "conversation": data.conversation,
         "context": data.context,
         "messages": [m.dict() for m in data.messages],
         "directory": new_dir,
         "directory_diff": diff_snapshots(old_dir, new_dir)
     })
-def generate_title_and_summary(messages: list[dict]):
+def generate_title_and_summary(messages: list[dict], summary: str = ""):
+    """
+    With a previous `summary`, `messages` are only the ones added since it
+    and the returned summary is the updated one for the whole conversation.
+    """
     prompt = [
         {
             "role": "system",
@@ -346,15 +2611,18 @@ Return STRICT JSON with:
 - summary: one concise paragraph summarizing user goals, facts, and decisions
 
 Do NOT add explanations.
-"""
+""" + ("""
+The input holds the current summary of the conversation and the messages
+added since; title and summary cover the whole conversation.
+""" if summary else "")
         },
         {
             "role": "user",
-            "content": json.dumps(messages)
+            "content": json.dumps({"summary": summary, "new_messages": messages} if summary else messages)
         }
     ]
 
-    result = ollama.chat(
+    result = background_chat(
         model="mistral",
         messages=prompt,
         format="json"
@@ -376,12 +2644,35 @@ Do NOT add explanations.
 
 from fastapi import BackgroundTasks
 
+def make_etag(*parts, request: Request = None) -> str:
+    # Query parameters select different representations, so they are part of the tag
+    if request is not None and request.url.query:
+        parts += (format(zlib.crc32(request.url.query.encode()), "x"),)
+    return '"' + "-".join(str(p) for p in parts) + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
 @app.post("/chat")
 async def chat(data: ChatRequest, background_tasks: BackgroundTasks):
+    # The client sends an empty assistant placeholder for the reply it is
+    # about to stream; keep it out of the stored history.
+    if data.messages and data.messages[-1].role == "assistant" and not data.messages[-1].content:
+        data.messages.pop()
+
     # Load memory safely
     with memory_lock:
         global_mem = load_global_memory()
         conv_mem = load_conv_memory(data.conversation)
+    # Leave out bookkeeping such as summarized_upto/summarized_hash
+    conv_mem = {"summary": conv_mem.get("summary", ""), "notes": conv_mem.get("notes", [])}
 
     system_prompt = {
         "role": "system",
@@ -408,36 +2699,13 @@ Use it to guide your responses, but do NOT repeat it verbatim to the user.
         # Append assistant reply
         data.messages.append(ChatMessage(role="assistant", content=full_response))
 
-        path = conv_path(data.conversation)
-        conv_data = load_json(path, {})
+        # Save conversation; stores that support it only append the new turn
+        store.save_turn(data.conversation, [m.dict() for m in data.messages], {"context": data.context})
 
-        try:
-            meta = generate_title_and_summary(
-                [m.dict() for m in data.messages]
-            )
-        except Exception as e:
-            logging.error(f"Metadata generation failed: {e}")
-            meta = {
-                "title": conv_data.get("title", "New Conversation"),
-                "summary": ""
-            }
-
-        # Save conversation
-        save_json(path, {
-            "conversation": data.conversation,
-            "title": meta["title"],
-            "context": data.context,
-            "messages": [m.dict() for m in data.messages],
-            "directory": conv_data.get("directory", {}),
-            "directory_diff": conv_data.get("directory_diff", {})
-        })
-
-        # Save conversation memory
-        with memory_lock:
-            save_json(conv_memory_path(data.conversation), {
-                "summary": meta["summary"],
-                "notes": []
-            })
+        # Title and summary are generated off the request path, when
+        # summary_delay says they are due; this job also stands in for the
+        # summary the watcher would queue for the turn
+        job_queue.submit("summary", data.conversation, priority=PRIORITY_CHAT, title=True)
 
     def stream_gen():
         nonlocal full_response
@@ -456,7 +2724,7 @@ Use it to guide your responses, but do NOT repeat it verbatim to the user.
 async def create_conversation(payload: ConversationCreate):
     conv_id = next_conversation_id()
 
-    save_json(conv_path(conv_id), {
+    store.save(conv_id, {
         "conversation": conv_id,
         "title": payload.title,
         "context": "default",
@@ -468,48 +2736,211 @@ async def create_conversation(payload: ConversationCreate):
         "directory_diff": {}
     })
 
-    save_json(conv_memory_path(conv_id), {
+    store.save_memory(conv_id, {
         "summary": "",
         "notes": []
     })
 
     return {"id": conv_id, "title": payload.title}
 
+LISTING_FIELDS = ("id", "title", "updated_at", "message_count", "size", "revision")
+
+def encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor: str) -> list:
+    key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(key, list):
+        raise ValueError("cursor must decode to a sort key")
+    return key
+
 @app.get("/conversations")
-async def list_conversations():
-    items = []
-    for f in sorted(os.listdir(CONV_DIR)):
-        with open(os.path.join(CONV_DIR, f)) as fh:
-            data = json.load(fh)
-        items.append({
-            "id": data["conversation"],
-            "title": data.get("title", "New Conversation")
-        })
-    return {"conversations": items}
+async def list_conversations(
+    request: Request,
+    sort: str = "id",
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    fields: str = "id,title"
+):
+    """
+    sort=id lists oldest first, sort=updated lists most recent activity first.
+    With limit, the response carries next_cursor until the listing is exhausted.
+    fields selects which index columns are returned.
+    """
+    etag = make_etag("index", conversation_index.version(), request=request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    selected = [f for f in fields.split(",") if f]
+    unknown = [f for f in selected if f not in LISTING_FIELDS]
+    if unknown:
+        return JSONResponse(status_code=400, content={"error": f"Unknown fields: {unknown}"})
+
+    entries = conversation_index.list()
+    if sort == "updated":
+        sort_key = lambda e: [-e.get("updated_at", 0), e["id"]]
+        key_types = [(int, float), int]
+    elif sort == "id":
+        sort_key = lambda e: [e["id"]]
+        key_types = [int]
+    else:
+        return JSONResponse(status_code=400, content={"error": f"Unknown sort: {sort}"})
+    entries.sort(key=sort_key)
+
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            return JSONResponse(status_code=400, content={"error": "Invalid cursor"})
+        # A cursor from another sort order cannot be compared with this one
+        if len(after) != len(key_types) or any(
+            isinstance(value, bool) or not isinstance(value, types)
+            for value, types in zip(after, key_types)
+        ):
+            return JSONResponse(status_code=400, content={"error": "Invalid cursor"})
+        entries = [e for e in entries if sort_key(e) > after]
+
+    next_cursor = None
+    if limit is not None and len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(sort_key(entries[-1]))
+
+    items = [{f: entry.get(f) for f in selected} for entry in entries]
+    response = {"conversations": items}
+    if next_cursor:
+        response["next_cursor"] = next_cursor
+    return JSONResponse(content=response, headers={"ETag": etag})
+
+@app.post("/conversations/batch")
+async def batch_conversations(payload: ConversationBatch):
+    """
+    Stream the selected conversations as NDJSON, one object per line, in the
+    requested order. Files are read concurrently; ids that do not exist yield
+    {"conversation": id, "error": "Not found"}.
+    """
+    if payload.ids is not None and payload.limit is not None:
+        return JSONResponse(status_code=400, content={"error": "Pass either ids or limit, not both"})
+    if payload.ids is not None:
+        ids = payload.ids
+    else:
+        entries = sorted(
+            conversation_index.list(),
+            key=lambda e: (-e.get("updated_at", 0), e["id"])
+        )
+        ids = [e["id"] for e in entries[:payload.limit]]
+
+    def stream_batch():
+        with ThreadPoolExecutor(max_workers=BULK_READ_WORKERS) as pool:
+            # Like GET /conversation/{id}, without the directory snapshots
+            windows = pool.map(lambda i: store.load_window(i, include_directory=False), ids)
+            for conv_id, window in zip(ids, windows):
+                if window is None:
+                    data = {"conversation": conv_id, "error": "Not found"}
+                else:
+                    data = window[0]
+                yield json.dumps(data) + "\n"
+
+    return StreamingResponse(stream_batch(), media_type="application/x-ndjson")
 
 @app.get("/conversation/{conv_id}")
-async def get_conversation(conv_id: int):
-    path = conv_path(conv_id)
-    if not os.path.exists(path):
+async def get_conversation(
+    request: Request,
+    conv_id: int,
+    before: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    include_directory: bool = False
+):
+    """
+    Without parameters all messages are returned. `limit` (and optionally
+    `before`, a message index) selects a window; `offset` is the index of
+    the first returned message and `message_count` the full length, so the
+    client can page backwards with before=offset. The stored directory
+    snapshot is only included on request.
+    """
+    revision = conversation_index.revision(conv_id)
+    etag = make_etag("conv", conv_id, revision, request=request)
+    if revision is not None and etag_matches(request, etag):
+        return not_modified(etag)
+
+    window = store.load_window(conv_id, before, limit, include_directory)
+    if window is None:
+        return JSONResponse(status_code=404, content={"error": "Not found"})
+    data, start, total = window
+    if "directory" in data:
+        data["directory"] = flatten_snapshot(data["directory"])
+    data["offset"] = start
+    data["message_count"] = total
+    return JSONResponse(content=data, headers={"ETag": etag})
+
+@app.post("/conversation/{conv_id}/title", status_code=202)
+async def regenerate_title(conv_id: int):
+    """Generate a new title (and summary); otherwise the first one is kept."""
+    if not store.exists(conv_id):
         return JSONResponse(status_code=404, content={"error": "Not found"})
-    return load_json(path, {})
+    job_queue.submit("summary", conv_id, priority=PRIORITY_CHAT, title=True, force=True)
+    return {"status": "queued"}
 
 @app.delete("/conversation/{conv_id}", status_code=204)
 async def delete_conversation(conv_id: int):
     with memory_lock:
-        for p in [conv_path(conv_id), conv_memory_path(conv_id)]:
-            if os.path.exists(p):
-                os.remove(p)
+        store.delete(conv_id)
+    retract_conversations([conv_id])
     return {}
 
+# ---------------- Change Feed ----------------
+
+CHANGES_POLL_INTERVAL = 0.25
+
+@app.get("/changes")
+async def get_changes(since: int = 0, wait: float = 0):
+    """
+    Changes after `since`, newest state per conversation/memory only. Pass
+    the returned `seq` as the next `since`. With wait > 0 the request is held
+    open (up to 60 s) until something changes.
+    """
+    deadline = time.monotonic() + min(wait, 60)
+    while change_feed.last_seq() <= since and time.monotonic() < deadline:
+        await asyncio.sleep(CHANGES_POLL_INTERVAL)
+    return {"seq": change_feed.last_seq(), "changes": change_feed.since(since)}
+
 # ---------------- Memory API ----------------
 
+@app.get("/memory/status")
+async def get_memory_status():
+    """Progress of the global memory rebuild started at startup, and job counts by status."""
+    with rebuild_status_lock:
+        status = dict(rebuild_status)
+    status["jobs"] = job_store.counts()
+    return status
+
+@app.get("/memory/global")
+async def get_global_memory(request: Request):
+    st = os.stat(GLOBAL_MEMORY_PATH)
+    etag = make_etag("global", st.st_mtime_ns, st.st_size)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    with memory_lock:
+        mem = load_global_memory()
+    return JSONResponse(content=mem, headers={"ETag": etag})
+
+@app.get("/memory/conversation/{conv_id}")
+async def get_conversation_memory(request: Request, conv_id: int):
+    revision = conversation_index.revision(conv_id)
+    if revision is None:
+        return JSONResponse(status_code=404, content={"error": "Not found"})
+    etag = make_etag("memory", conv_id, revision)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    with memory_lock:
+        mem = load_conv_memory(conv_id)
+    return JSONResponse(content=mem, headers={"ETag": etag})
+
 @app.post("/memory/global")
 async def add_global_memory(payload: MemoryUpdate):
     with memory_lock:
-        mem = load_global_memory()
-        mem["facts"].append(payload.content)
-        save_json(GLOBAL_MEMORY_PATH, mem)
+        provenance = load_provenance()
+        provenance["manual"].append(payload.content)
+        save_provenance(provenance)
     return {"status": "saved"}
 
 @app.post("/memory/conversation/{conv_id}")
@@ -517,5 +2948,40 @@ async def add_conversation_memory(conv_id: int, payload: MemoryUpdate):
     with memory_lock:
         mem = load_conv_memory(conv_id)
         mem["notes"].append(payload.content)
-        save_json(conv_memory_path(conv_id), mem)
+        store.save_memory(conv_id, mem)
     return {"status": "saved"}
+
+# =========================================================
+# Command Line
+# =========================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Iris backend maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate", help="import JSON conversations into SQLite")
+    migrate.add_argument("--force", action="store_true", help="re-import even if already migrated")
+
+    commands.add_parser("rebuild-index", help="recreate the conversation index from storage")
+
+    bench = commands.add_parser("bench-hash", help="compare file_hash algorithms")
+    bench.add_argument("--size-mb", type=int, default=64, help="size of the generated test file")
+    bench.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = SqliteConversationStore(DB_PATH).migrate_from_json(force=args.force)
+        print(f"Imported {count} conversations into {DB_PATH}")
+    elif args.command == "rebuild-index":
+        count = conversation_index.rebuild(store)
+        print(f"Indexed {count} conversations into {INDEX_PATH}")
+    elif args.command == "bench-hash":
+        with tempfile.NamedTemporaryFile(suffix=".bin") as sample:
+            for _ in range(args.size_mb):
+                sample.write(os.urandom(1024 * 1024))
+            sample.flush()
+            for name, speed in benchmark_file_hash(sample.name, args.repeat).items():
+                print(f"{name:20} {speed:10.1f} MB/s")